@@ -51,6 +51,13 @@ class DataSaver(QObject):
             flow = data[2 + i * 2]
             self.flow_data_buffer.append((time_ms, index, flow))
 
+    @pyqtSlot(list)
+    def save_flow_batch(self, frames):
+        """Buffers a batch of flow frames received in one serial read."""
+        if not self.saving: return
+        for data in frames:
+            self.save_flow_data(data)
+
     @pyqtSlot(list)
     def save_temp_data(self, data):
         """Buffers incoming temperature data."""
@@ -64,6 +71,13 @@ class DataSaver(QObject):
             duty_percent = (duty_raw / 65535.0) * 100.0
             self.temp_data_buffer.append((time_ms, index, temp, f"{duty_percent:.2f}"))
 
+    @pyqtSlot(list)
+    def save_temp_batch(self, frames):
+        """Buffers a batch of temperature frames received in one serial read."""
+        if not self.saving: return
+        for data in frames:
+            self.save_temp_data(data)
+
     @pyqtSlot(list)
     def save_do_data(self, data):
         """Buffers incoming DO sensor data.
@@ -215,8 +229,6 @@ class DataSaver(QObject):
                 for sub_key, data_array in value_dict.items():
                     sliced_dict[key][sub_key] = data_array[mask]
 
-        print(f"Sliced data from {start_time} to {end_time}")
-        print(sliced_dict)
         return sliced_dict
 
     def slice_single_dataset_by_time(self, data_dict, start_time=None, end_time=None):
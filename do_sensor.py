@@ -1,12 +1,14 @@
+import logging
 import numpy as np
 from PyQt5.QtCore import QThread, pyqtSignal, QObject
 from mcu import MCUCommands
 from collections import deque
-import os
 from do_sensor_calibration.clarke_electrode import ClarkeElectrode,load_vapor_pressure_func
 from do_sensor_calibration.blood_oxygen_dissociation_models import HemoglobinDissociationDash2010
 from enum import Enum
 
+logger = logging.getLogger(__name__)
+
 class FluidType(Enum):
     WATER = 'water'
     BLOOD = 'blood'
@@ -17,10 +19,10 @@ class DOUnits(Enum):
     SO2_PERCENT = 'so2 %%'
 class DOCommands(MCUCommands):
     #DO Sensor Commands
-    DO_START = '$DOSSR,START,'
-    DO_STOP = '$DOSSR,STOP,'
-    DO_HELP = '$DOSSR,HELP,'
-    DO_INFO = '$DOSSR,INFO,'
+    DO_START = b'$DOSSR,START,'
+    DO_STOP = b'$DOSSR,STOP,'
+    DO_HELP = b'$DOSSR,HELP,'
+    DO_INFO = b'$DOSSR,INFO,'
     def start_stop(self, start=True):
         """Starts or stops DO sensor readings."""
         base_command = DOCommands.DO_START if start else DOCommands.DO_STOP
@@ -42,8 +44,8 @@ class DOCommands(MCUCommands):
 
 
 class DOSensorThread(QThread):
-    # Signal now emits the command string and its unique communication ID
-    mcu_signal = pyqtSignal(str, str)
+    # Signal emits the command bytes and their unique communication ID
+    mcu_signal = pyqtSignal(bytes, bytes)
     update_plot_signal = pyqtSignal()  # Signal containing data to be logged and plotted
     save_data_signal = pyqtSignal(list)  # Signal containing data to be saved to file
     commands = DOCommands()
@@ -58,17 +60,17 @@ class DOSensorThread(QThread):
 
     def do_start_stop(self, start=True):
         command, com_id = self.commands.start_stop(start=start)
-        #print(f"DO Thread: Queuing command {com_id}")
+        logger.debug("DO Thread: Queuing command %s", com_id)
         self.mcu_signal.emit(command, com_id)
 
     def do_info(self):
         command, com_id = self.commands.info()
-        #print(f"DO Thread: Queuing command {com_id}")
+        logger.debug("DO Thread: Queuing command %s", com_id)
         self.mcu_signal.emit(command, com_id)
 
     def do_help(self):
         command, com_id = self.commands.help()
-        #print(f"DO Thread: Queuing command {com_id}")
+        logger.debug("DO Thread: Queuing command %s", com_id)
         self.mcu_signal.emit(command, com_id)
 
     def do_enable(self,target_id, enable=True):
@@ -111,7 +113,6 @@ class DOSensorThread(QThread):
     def update_dissociation_parameters(self, pH: float, pCO2:float):
         for sensor in self.do_sensors:
             sensor.update_hemoglobin_parameters(pH=pH, pCO2=pCO2, DPG=None, Hct=None)
-        print(sensor.hemoglobin_model.pH, sensor.hemoglobin_model.pCO2)
 
     def update_fluid_type(self, fluid_type: FluidType):
         for sensor in self.do_sensors:
@@ -129,7 +130,6 @@ class do_sensor:
         self.time_buffer = deque(maxlen=buffer_size)
         self.temperature_celsius = 25.0  # Default temperature for saturation calculation
         self.hemoglobin_model = HemoglobinDissociationDash2010()
-        print(os.getcwd())
         vapor_pressure_func = load_vapor_pressure_func(r"do_sensor_calibration/water_vapor_pressure.csv")
         self.clarke_electrode = ClarkeElectrode(vapor_pressure_func=vapor_pressure_func)
         self.temperature_celsius = None  # Current temperature for calibration
@@ -1,5 +1,6 @@
 # clarke_electrode.py
 
+import functools
 import numpy as np
 from scipy.interpolate import interp1d
 import matplotlib.pyplot as plt
@@ -116,7 +117,7 @@ class ClarkeElectrode:
             raise RuntimeError("Calibration is invalid: no overlapping temperature range.")
         start, end = valid_range
         if np.any((temperature < start) | (temperature > end)):
-            print(f"Warning: Temperature is outside valid range of {start:.2f}°C to {end:.2f}°C.")
+            # Called for every DO sample, so an out-of-range temperature is only reported through the NaN result
             return np.NaN
         high_sat = self.cal_points['high'].saturation
         henrys_po2_high = self.compute_henrys_pO2(temperature, so2=high_sat)
@@ -201,7 +202,9 @@ class ElectrodeVisualizer:
         plt.show()
 
 
+@functools.lru_cache(maxsize=None)
 def load_vapor_pressure_func(file_path: str) -> Callable:
+    # Cached: every DO sensor loads the same table, so the CSV is parsed once and the interpolator shared
     try:
         data = np.loadtxt(file_path, delimiter=',', skiprows=2)
         return interp1d(data[:, 0], data[:, 1], bounds_error=True)
@@ -1,33 +1,31 @@
 ### High level commands class for the control of the syringe flow_controller
+import logging
 from PyQt5.QtCore import QThread, pyqtSignal, QObject
 from mcu import MCUCommands
 from collections import deque
-import serial
-import time
-import sys
-import os
-import numpy as np
+
+logger = logging.getLogger(__name__)
 
 
 class FlowControllerCommands(MCUCommands):
     # Class that defines flow controller related commands understood by the microcontroller
     # Includes methods to generate the commands with the correct format
-    FLOW_START = '$FLOWCTRL,START,'
-    FLOW_STOP = '$FLOWCTRL,STOP,'
-    FLOW_MODE_PID = '$FLOWCTRL,SET_MODE_PID,'
-    FLOW_MODE_CONSTANT = '$FLOWCTRL,SET_MODE_CONSTANT,'
-    FLOW_SET_FLOWRATE = '$FLOWCTRL,SET_FLOWRATE,'
-    FLOW_SSR_ENABLE = '$FLOWCTRL,SSR_ENABLE,'
-    FLOW_SSR_DISABLE = '$FLOWCTRL,SSR_DISABLE,'
-    FLOW_SSR_RESET = '$FLOWCTRL,SSR_RESET,'
-    FLOW_CONT_READ_ON = '$FLOWCTRL,CONT_FLOWRATE_ON,'
-    FLOW_CONT_READ_OFF = '$FLOWCTRL,CONT_FLOWRATE_OFF,'
-    FLOW_SET_PUMP_SETTINGS = '$FLOWCTRL,SET_PUMP_SETTINGS,'
-    FLOW_SET_PID = '$FLOWCTRL,SET_PID_SETTINGS,'
-    FLOW_START_DISPENSE = '$FLOWCTRL,START_DISPENSE,'
-    FLOW_STOP_DISPENSE = '$FLOWCTRL,STOP_DISPENSE,'
-    FLOW_INFO = '$FLOWCTRL,INFO,'
-    FLOW_HELP = '$FLOWCTRL,HELP,'
+    FLOW_START = b'$FLOWCTRL,START,'
+    FLOW_STOP = b'$FLOWCTRL,STOP,'
+    FLOW_MODE_PID = b'$FLOWCTRL,SET_MODE_PID,'
+    FLOW_MODE_CONSTANT = b'$FLOWCTRL,SET_MODE_CONSTANT,'
+    FLOW_SET_FLOWRATE = b'$FLOWCTRL,SET_FLOWRATE,'
+    FLOW_SSR_ENABLE = b'$FLOWCTRL,SSR_ENABLE,'
+    FLOW_SSR_DISABLE = b'$FLOWCTRL,SSR_DISABLE,'
+    FLOW_SSR_RESET = b'$FLOWCTRL,SSR_RESET,'
+    FLOW_CONT_READ_ON = b'$FLOWCTRL,CONT_FLOWRATE_ON,'
+    FLOW_CONT_READ_OFF = b'$FLOWCTRL,CONT_FLOWRATE_OFF,'
+    FLOW_SET_PUMP_SETTINGS = b'$FLOWCTRL,SET_PUMP_SETTINGS,'
+    FLOW_SET_PID = b'$FLOWCTRL,SET_PID_SETTINGS,'
+    FLOW_START_DISPENSE = b'$FLOWCTRL,START_DISPENSE,'
+    FLOW_STOP_DISPENSE = b'$FLOWCTRL,STOP_DISPENSE,'
+    FLOW_INFO = b'$FLOWCTRL,INFO,'
+    FLOW_HELP = b'$FLOWCTRL,HELP,'
 
     # ----- Flow Controller Methods -----
     def start_stop(self, targets: int, start=True):
@@ -109,8 +107,10 @@ class FlowControllerCommands(MCUCommands):
 
 
 class FlowControllerThread(QThread):
-    # Signal now emits the command string and its unique communication ID
-    mcu_signal = pyqtSignal(str, str)
+    # Signal emits the command bytes and their unique communication ID
+    mcu_signal = pyqtSignal(bytes, bytes)
+    # Emits a list of (command, com_id) tuples that are queued together and written in as few writes as possible
+    mcu_batch_signal = pyqtSignal(list)
     update_plot_signal = pyqtSignal()  # Signal containing data to be logged and plotted
     commands = FlowControllerCommands()
 
@@ -119,10 +119,18 @@ class FlowControllerThread(QThread):
         self.num_flow_controllers = 4
         self.flow_controllers = []
         self.continuous_reading = False
+        self._batch = None  # Collects the commands instead of emitting them one by one while set_all runs
         # The continuous_reading state is managed by the GUI and MCU, not here.
         for i in range(self.num_flow_controllers):
             self.flow_controllers.append(flow_controller(2 ** i))
 
+    def _send(self, command, com_id):
+        logger.debug("FC Thread: Queuing command %s -> %s", com_id, command)
+        if self._batch is None:
+            self.mcu_signal.emit(command, com_id)
+        else:
+            self._batch.append((command, com_id))
+
     def set_pump_type(self, flow_controller_index, pump_type):
         """Sets the pump type for a specific flow controller."""
         self.flow_controllers[flow_controller_index].set_pump_type(pump_type)
@@ -132,8 +140,7 @@ class FlowControllerThread(QThread):
             self.flow_controllers[flow_controller_index].set_flowrate(flowrate)
         target = self.flow_controllers[flow_controller_index].num
         command, com_id = self.commands.set_flowrate(target, self.flow_controllers[flow_controller_index].flowrate)
-        #print(f"FC Thread: Queuing command {com_id} -> {command.strip()}")
-        self.mcu_signal.emit(command, com_id)
+        self._send(command, com_id)
 
     def set_mode(self, flow_controller_index, mode=None):
         if mode:
@@ -147,15 +154,13 @@ class FlowControllerThread(QThread):
             raise ValueError('Invalid mode. Mode must be "PID" or "Constant".')
 
         command, com_id = self.commands.set_mode(target, is_pid_mode)
-        #print(f"FC Thread: Queuing command {com_id} -> {command.strip()}")
-        self.mcu_signal.emit(command, com_id)
+        self._send(command, com_id)
 
     def set_sensor(self, flow_controller_index, sensor):
         self.flow_controllers[flow_controller_index].set_parameters(sensor=sensor)
         target = self.flow_controllers[flow_controller_index].num
         command, com_id = self.commands.ssr_enable_disable(target, sensor)
-        #print(f"FC Thread: Queuing command {com_id} -> {command.strip()}")
-        self.mcu_signal.emit(command, com_id)
+        self._send(command, com_id)
         # NOTE: Logic to turn continuous reading on/off is now handled in the main GUI class,
         # which has the global view of all sensors. This avoids race conditions and timing issues.
 
@@ -171,8 +176,7 @@ class FlowControllerThread(QThread):
                                                 self.flow_controllers[flow_controller_index].Kp,
                                                 self.flow_controllers[flow_controller_index].Ki,
                                                 self.flow_controllers[flow_controller_index].Kd)
-        #print(f"FC Thread: Queuing command {com_id} -> {command.strip()}")
-        self.mcu_signal.emit(command, com_id)
+        self._send(command, com_id)
 
     def set_parameters_syringe(self, flow_controller_index, diameter=None, thread_pitch=None):
         if diameter:
@@ -183,8 +187,7 @@ class FlowControllerThread(QThread):
         command, com_id = self.commands.pump_settings(target, 'SYRINGE',
                                                       self.flow_controllers[flow_controller_index].diameter,
                                                       self.flow_controllers[flow_controller_index].thread_pitch)
-        #print(f"FC Thread: Queuing command {com_id} -> {command.strip()}")
-        self.mcu_signal.emit(command, com_id)
+        self._send(command, com_id)
 
     def set_parameters_peristaltic(self, flow_controller_index, tube_diameter=None, calibration=None):
         if tube_diameter:
@@ -196,53 +199,62 @@ class FlowControllerThread(QThread):
                                                       self.flow_controllers[flow_controller_index].tube_diameter,
                                                       self.flow_controllers[
                                                           flow_controller_index].peristaltic_calibration)
-        #print(f"FC Thread: Queuing command {com_id} -> {command.strip()}")
-        self.mcu_signal.emit(command, com_id)
+        self._send(command, com_id)
 
     def start_stop(self, flow_controller_index, start=True):
         self.flow_controllers[flow_controller_index].set_active(start)
         target = self.flow_controllers[flow_controller_index].num
         command, com_id = self.commands.start_stop(target, start)
-        #print(f"FC Thread: Queuing command {com_id} -> {command.strip()}")
-        self.mcu_signal.emit(command, com_id)
+        self._send(command, com_id)
 
     def reset_sensors(self):
         command, com_id = self.commands.ssr_reset()
-        #print(f"FC Thread: Queuing command {com_id} -> {command.strip()}")
-        self.mcu_signal.emit(command, com_id)
+        self._send(command, com_id)
 
     def set_continuous_reading(self, on=True):
         # This method is now called by the main GUI thread when appropriate
+        self.continuous_reading = on
         command, com_id = self.commands.continuous_read(on)
-        #print(f"FC Thread: Queuing command {com_id} -> {command.strip()}")
-        self.mcu_signal.emit(command, com_id)
+        self._send(command, com_id)
 
     def start_dispense(self, flow_controller_index, volume_to_dispense, flowrate):
         target = self.flow_controllers[flow_controller_index].num
         command, com_id = self.commands.start_dispense(target, volume_to_dispense, flowrate)
-        #print(f"FC Thread: Queuing command {com_id} -> {command.strip()}")
-        self.mcu_signal.emit(command, com_id)
+        self._send(command, com_id)
 
     def stop_dispense(self, flow_controller_index):
         target = self.flow_controllers[flow_controller_index].num
         command, com_id = self.commands.stop_dispense(target)
-        #print(f"FC Thread: Queuing command {com_id} -> {command.strip()}")
-        self.mcu_signal.emit(command, com_id)
+        self._send(command, com_id)
 
     def set_all(self, flow_controller_index):
-        # This method will now correctly queue all commands sequentially
-        self.set_mode(flow_controller_index)
-        self.set_flowrate(flow_controller_index, self.flow_controllers[flow_controller_index].flowrate)
-        self.set_sensor(flow_controller_index, self.flow_controllers[flow_controller_index].sensor)
-        if self.flow_controllers[flow_controller_index].pump_type == pump_types.syringe:
-            self.set_parameters_syringe(flow_controller_index)
-        elif self.flow_controllers[flow_controller_index].pump_type == pump_types.peristaltic:
-            self.set_parameters_peristaltic(flow_controller_index)
-        self.set_pid(flow_controller_index)
-
-    def process_flow_serial_data(self, data: list):
-        # Process the incoming flow controller data
-        # Data format: [time_ms, index_1, flow_1, index_2, flow_2,...] depending on number of controllers that are enabled
+        # All the commands are collected and handed to the MCU worker as a single batch, in order
+        self._batch = []
+        try:
+            self.set_mode(flow_controller_index)
+            self.set_flowrate(flow_controller_index, self.flow_controllers[flow_controller_index].flowrate)
+            self.set_sensor(flow_controller_index, self.flow_controllers[flow_controller_index].sensor)
+            if self.flow_controllers[flow_controller_index].pump_type == pump_types.syringe:
+                self.set_parameters_syringe(flow_controller_index)
+            elif self.flow_controllers[flow_controller_index].pump_type == pump_types.peristaltic:
+                self.set_parameters_peristaltic(flow_controller_index)
+            self.set_pid(flow_controller_index)
+        finally:
+            batch, self._batch = self._batch, None
+        self.mcu_batch_signal.emit(batch)
+
+    def process_flow_serial_batch(self, frames: list):
+        # Process all the flow frames received in one serial read, then refresh the plot once
+        # Frame format: [time_ms, index_1, flow_1, index_2, flow_2,...] depending on number of controllers that are enabled
+        new_data = False
+        for data in frames:
+            if self._add_flow_frame(data):
+                new_data = True
+        if new_data:
+            self.update_plot_signal.emit()
+
+    def _add_flow_frame(self, data: list):
+        # Adds one flow frame to the controller buffers, returns True if any enabled sensor got new data
         data_length = len(data)
         num_controllers_in_data = (data_length - 1) // 2
         new_data = False
@@ -253,9 +265,7 @@ class FlowControllerThread(QThread):
                 if controller.num == index and controller.sensor:
                     new_data = True
                     controller.add_data(flow=flow, time_ms=data[0])
-        # Emit a signal
-        if new_data:
-            self.update_plot_signal.emit()
+        return new_data
 
     def clear_buffers(self):
         for controller in self.flow_controllers:
@@ -311,20 +321,22 @@ class flow_controller:
             self.Kd = Kd
 
     def info(self):
-        # print flow_controller properties
-        print('----------------------')
-        print(f'flow_controller {self.num} info:')
-        print(f'flow_controller name: {self.name}')
-        print(f'flow_controller mode: {self.mode}')
-        print(f'flow_controller flow rate: {self.flowrate}')
-        print(f'flow_controller active: {self.active}')
-        print(f'Syringe diameter: {self.diameter}')
-        print(f'flow_controller thread pitch: {self.thread_pitch}')
-        print(f'flow_controller sensor: {self.sensor}')
-        print(f'flow_controller Kp: {self.Kp}')
-        print(f'flow_controller Ki: {self.Ki}')
-        print(f'flow_controller Kd: {self.Kd}')
-        print(f'----------------------')
+        # log flow_controller properties
+        logger.debug('\n'.join([
+            '----------------------',
+            f'flow_controller {self.num} info:',
+            f'flow_controller name: {self.name}',
+            f'flow_controller mode: {self.mode}',
+            f'flow_controller flow rate: {self.flowrate}',
+            f'flow_controller active: {self.active}',
+            f'Syringe diameter: {self.diameter}',
+            f'flow_controller thread pitch: {self.thread_pitch}',
+            f'flow_controller sensor: {self.sensor}',
+            f'flow_controller Kp: {self.Kp}',
+            f'flow_controller Ki: {self.Ki}',
+            f'flow_controller Kd: {self.Kd}',
+            '----------------------',
+        ]))
 
     def set_parameters(self, sensor=None, diameter=None, thread_pitch=None, peristaltic_cal=None, tube_diameter=None,
                        name=None):
@@ -47,7 +47,8 @@ class GUIUpdater(QThread):
         self.temp_plot_widget.clear()
         for i,controller in enumerate(self.temp_controllers):
             if controller.sensor:
-                self.temp_plot_widget.plot(list(controller.time_buffer), list(controller.temp_buffer), pen=self.temp_pen_colors[i], name=controller.name)
+                time_view, temp_view = controller.get_view()
+                self.temp_plot_widget.plot(time_view, temp_view, pen=self.temp_pen_colors[i], name=controller.name)
 
 
     def update_flow_plot(self):
@@ -71,13 +72,10 @@ class GUIUpdater(QThread):
         # updates the plot y-axis label based on the selected units
         self.current_do_units = units
         if units == DOUnits.VOLTAGE:
-            print(DOUnits.VOLTAGE)
             self.do_plot_widget.setLabel('left', 'DO Sensor [V]')
         elif units == DOUnits.PO2_MMHG:
-            print(DOUnits.PO2_MMHG)
             self.do_plot_widget.setLabel('left', 'Oxygen Partial pressure PO2 [mmHg]')
         elif units == DOUnits.SO2_PERCENT:
-            print(DOUnits.SO2_PERCENT)
             self.do_plot_widget.setLabel('left', 'Oxygen saturation SO2 [-]')
 
         self.clear_buffers_signal.emit()
@@ -3,10 +3,11 @@ from PyQt5.QtWidgets import QApplication, QMainWindow, QLabel, QLineEdit, QPushB
     QWidget, QGridLayout, QTextEdit, QFileDialog, QComboBox, QGroupBox, QCheckBox, QDialog
 from PyQt5.QtGui import QPixmap
 from pyqtgraph import PlotWidget
-from PyQt5.QtCore import QThread, pyqtSignal, QObject, Qt, QMetaObject
+from PyQt5.QtCore import QThread, pyqtSignal, QObject, Qt, QMetaObject, QSignalBlocker, QTimer
 import configparser
 import os
 import functools
+import logging
 from mcu import MCUWorker
 from guiupdater import GUIUpdater
 from flow_controller import FlowControllerThread
@@ -16,6 +17,8 @@ from datasaver import DataSaver
 from sequencerunner import SequenceRunner
 from calibration_window import CalibrationWindow
 
+logger = logging.getLogger(__name__)
+
 
 class App(QMainWindow, QObject):
     """
@@ -83,6 +86,11 @@ class App(QMainWindow, QObject):
         self.running = False
         self.connected = False
         self.recording = False
+        self._controls_enabled = True
+        self._pending_input_updates = {}  # QLineEdit -> latest value pushed by the sequence runner
+        self._fc_sensors_on = 0  # Number of flow sensors currently enabled
+        self._tc_sensors_on = 0  # Number of temperature sensors currently enabled
+        self._suppress_continuous_signal = False
         self.num_flow_controllers = 4
         self.num_temp_controllers = 2
         self.num_do_sensors = 2
@@ -329,6 +337,9 @@ class App(QMainWindow, QObject):
 
     def _set_controls_enabled(self, enabled):
         """Enable or disable all flow and temperature controller UI elements."""
+        if self._controls_enabled == enabled:
+            return
+        self._controls_enabled = enabled
         # Flow controller widgets
         for i in range(self.num_flow_controllers):
             self.pump_type_dropdowns[i].setEnabled(enabled)
@@ -375,6 +386,9 @@ class App(QMainWindow, QObject):
         self.mcu_thread.setObjectName("MCU_Thread")
         self.mcu_worker = MCUWorker()
         self.mcu_worker.moveToThread(self.mcu_thread)
+        self.mcu_parser_thread = QThread()
+        self.mcu_parser_thread.setObjectName("MCU_Parser_Thread")
+        self.mcu_worker.parser_worker.moveToThread(self.mcu_parser_thread)
         # ---
 
         # --- Sequence Runner Setup ---
@@ -402,6 +416,11 @@ class App(QMainWindow, QObject):
                                       self.temp_controllers.temperature_controllers,
                                       self.do_sensors.do_sensors)
 
+        # Coalesces sequence-driven input updates into at most one repaint per frame
+        self.input_update_timer = QTimer(self)
+        self.input_update_timer.setSingleShot(True)
+        self.input_update_timer.setInterval(16)
+
     def _connect_signals(self):
         """Connects all signals to their corresponding slots."""
         # Button Clicks
@@ -413,6 +432,7 @@ class App(QMainWindow, QObject):
         self.load_sequence_button.clicked.connect(self.sequence_onclick)
         self.do_sensor_calibrate_button.clicked.connect(self.open_calibration_window)
         self.reset_plot_button.clicked.connect(self.reset_plot_button_onclick)
+        self.input_update_timer.timeout.connect(self._flush_pending_input_updates)
 
         # Flow Controller Inputs
         for i in range(self.num_flow_controllers):
@@ -460,15 +480,15 @@ class App(QMainWindow, QObject):
         self.mcu_worker.connected_signal.connect(self.gui_updater.update_connectdisconnect_button)
         self.mcu_worker.connected_signal.connect(self.update_connected)
         self.mcu_worker.parser.do_data_signal.connect(self.do_sensors.process_do_serial_data)
-        self.mcu_worker.parser.temp_data_signal.connect(self.temp_controllers.process_temp_serial_data)
-        self.mcu_worker.parser.flow_data_signal.connect(self.flow_controllers.process_flow_serial_data)
+        self.mcu_worker.parser_worker.temp_data_received.connect(self.temp_controllers.process_temp_serial_batch)
+        self.mcu_worker.parser_worker.flow_data_received.connect(self.flow_controllers.process_flow_serial_batch)
 
         # --- Data Saver Connections ---
         self.start_logging_signal.connect(self.data_saver.start_saving_to_file)
         self.stop_logging_signal.connect(self.data_saver.stop_save)
         # Connect MCU data directly to the saver
-        self.mcu_worker.parser.flow_data_signal.connect(self.data_saver.save_flow_data)
-        self.mcu_worker.parser.temp_data_signal.connect(self.data_saver.save_temp_data)
+        self.mcu_worker.parser_worker.flow_data_received.connect(self.data_saver.save_flow_batch)
+        self.mcu_worker.parser_worker.temp_data_received.connect(self.data_saver.save_temp_batch)
 
         # Flow Controller Signals (from GUI to worker)
         self.fc_pump_settings_peristaltic_signal.connect(self.flow_controllers.set_parameters_peristaltic)
@@ -481,6 +501,7 @@ class App(QMainWindow, QObject):
         self.fc_sensor_change_signal.connect(self.flow_controllers.set_sensor)
         self.fc_continuous_reading_signal.connect(self.flow_controllers.set_continuous_reading)
         self.flow_controllers.mcu_signal.connect(self.mcu_worker.submit_command)
+        self.flow_controllers.mcu_batch_signal.connect(self.mcu_worker.submit_commands)
         self.flow_controllers.update_plot_signal.connect(self.gui_updater.update_flow_plot)
 
         # DO Sensor Signals (from GUI to worker)
@@ -533,6 +554,7 @@ class App(QMainWindow, QObject):
 
 
         self.mcu_thread.start()
+        self.mcu_parser_thread.start()
         self.sequence_thread.start()
         self.data_saver_thread.start()
         self.gui_updater.start()
@@ -543,9 +565,11 @@ class App(QMainWindow, QObject):
         #try to connect to mcu on startup
         self.mcu_connect_signal.emit()
         self.load_config('default.ini')
+        # Re-send every setting of each controller to the MCU as one batch, including the ones whose
+        # widgets did not change while the config was applied (the mode dropdown starts on 'PID').
         for i in range(self.num_flow_controllers):
-            self.flow_controllers.set_flowrate(i, float(self.flow_rate_inputs[i].text()))
-            self.flow_controllers.set_mode(i, self.flow_controller_dropdowns[i].currentText())
+            self.flow_controllers.flow_controllers[i].set_mode(self.flow_controller_dropdowns[i].currentText())
+            self.flow_controllers.set_all(i)
 
     def open_calibration_window(self):
         """Opens the DO sensor calibration window."""
@@ -590,12 +614,11 @@ class App(QMainWindow, QObject):
             pass
 
     def fc_pump_type_onchange(self, fc_index):
+        pump_type = self.pump_type_dropdowns[fc_index].currentText()
+        self.flow_controllers.set_pump_type(fc_index, pump_type)
+        fc = self.flow_controllers.flow_controllers[fc_index]
+        blockers = [QSignalBlocker(self.diameter_inputs[fc_index]), QSignalBlocker(self.pitch_inputs[fc_index])]
         try:
-            pump_type = self.pump_type_dropdowns[fc_index].currentText()
-            self.flow_controllers.set_pump_type(fc_index, pump_type)
-            fc = self.flow_controllers.flow_controllers[fc_index]
-            self.diameter_inputs[fc_index].blockSignals(True)
-            self.pitch_inputs[fc_index].blockSignals(True)
             if pump_type == 'Syringe':
                 self.diameter_label.setText("Syringe diameter [mm]:")
                 self.pitch_label.setText("Thread Pitch [mm/rev]:")
@@ -620,8 +643,8 @@ class App(QMainWindow, QObject):
                 self.diameter_inputs[fc_index].setEnabled(False)
                 self.pitch_inputs[fc_index].setEnabled(False)
         finally:
-            self.diameter_inputs[fc_index].blockSignals(False)
-            self.pitch_inputs[fc_index].blockSignals(False)
+            for blocker in blockers:
+                blocker.unblock()
 
     def fc_pump_parameter_input_onchange(self, fc_index):
         pump_type = self.pump_type_dropdowns[fc_index].currentText()
@@ -662,6 +685,7 @@ class App(QMainWindow, QObject):
     def fc_sensor_on_change(self, fc_index):
         try:
             state = self.sensor_dropdowns[fc_index].currentText()
+            was_enabled = bool(self.flow_controllers.flow_controllers[fc_index].sensor)
             dropdown = self.flow_controller_dropdowns[fc_index]
             pid_exists = dropdown.findText('PID') != -1
             if state == 'On':
@@ -675,14 +699,21 @@ class App(QMainWindow, QObject):
                         dropdown.setCurrentText('Constant')
                     dropdown.removeItem(dropdown.findText('PID'))
 
-            any_sensor_enabled = any(fc.sensor for fc in self.flow_controllers.flow_controllers)
-            if any_sensor_enabled and not self.flow_controllers.continuous_reading:
-                self.fc_continuous_reading_signal.emit(True)
-            elif not any_sensor_enabled and self.flow_controllers.continuous_reading:
-                self.fc_continuous_reading_signal.emit(False)
+            is_enabled = (state == 'On')
+            if is_enabled != was_enabled:
+                self._fc_sensors_on += 1 if is_enabled else -1
+            self._update_fc_continuous_reading()
         except IndexError:
             pass
 
+    def _update_fc_continuous_reading(self):
+        """Turns continuous flow reading on or off when the first sensor is enabled or the last is disabled."""
+        if self._suppress_continuous_signal:
+            return
+        any_sensor_enabled = self._fc_sensors_on > 0
+        if any_sensor_enabled != self.flow_controllers.continuous_reading:
+            self.fc_continuous_reading_signal.emit(any_sensor_enabled)
+
     def tc_enable_onchange(self, tc_index):
         try:
             enabled = self.temp_enable_checkboxes[tc_index].isChecked()
@@ -710,15 +741,22 @@ class App(QMainWindow, QObject):
         try:
             state = self.temp_sensor_dropdowns[tc_index].currentText()
             is_enabled = (state == 'On')
+            was_enabled = bool(self.temp_controllers.temperature_controllers[tc_index].sensor)
             self.tc_sensor_change_signal.emit(tc_index, is_enabled)
-            any_sensor_enabled = any(tc.sensor for tc in self.temp_controllers.temperature_controllers)
-            if any_sensor_enabled and not self.temp_controllers.continuous_reading:
-                self.tc_continuous_reading_signal.emit(True)
-            elif not any_sensor_enabled and self.temp_controllers.continuous_reading:
-                self.tc_continuous_reading_signal.emit(False)
+            if is_enabled != was_enabled:
+                self._tc_sensors_on += 1 if is_enabled else -1
+            self._update_tc_continuous_reading()
         except IndexError:
             pass
 
+    def _update_tc_continuous_reading(self):
+        """Turns continuous temperature reading on or off when the first sensor is enabled or the last is disabled."""
+        if self._suppress_continuous_signal:
+            return
+        any_sensor_enabled = self._tc_sensors_on > 0
+        if any_sensor_enabled != self.temp_controllers.continuous_reading:
+            self.tc_continuous_reading_signal.emit(any_sensor_enabled)
+
     def do_start_stop_onclick(self):
         if self.do_sensor_start_button.text() == "Start DO Reading":
             self.do_sensor_start_button.setText("Stop DO Reading")
@@ -765,9 +803,21 @@ class App(QMainWindow, QObject):
         if not os.path.exists(file_path):
             self.log_widget.append(f"Configuration file not found: {file_path}")
             return
-        config = configparser.ConfigParser()
+        config = configparser.ConfigParser(interpolation=None)
         config.read(file_path)
         self.log_widget.append(f'Loaded configuration from {file_path}')
+        # Sensor dropdowns flip one by one while the config is applied; hold back the
+        # continuous reading commands and send the final state once at the end.
+        self._suppress_continuous_signal = True
+        try:
+            self._apply_config(config)
+        finally:
+            self._suppress_continuous_signal = False
+        self._update_fc_continuous_reading()
+        self._update_tc_continuous_reading()
+
+    def _apply_config(self, config):
+        """Pushes the values of a parsed configuration into the UI controls."""
         for i in range(self.num_flow_controllers):
             section = f'Flow Controller {i + 1}'
             if not config.has_section(section): continue
@@ -818,17 +868,22 @@ class App(QMainWindow, QObject):
 
     def on_sequence_started(self):
         """Slot for when the sequence starts. Updates the GUI."""
-        self.load_sequence_button.setText("Stop Sequence")
+        self._set_sequence_button_text("Stop Sequence")
         self._set_controls_enabled(False)
 
     def on_sequence_finished(self):
         """Slot for when the sequence finishes or is stopped. Updates the GUI."""
-        self.load_sequence_button.setText("Load Sequence")
+        self._set_sequence_button_text("Load Sequence")
         self._set_controls_enabled(True)
         # Also stop any logging that was initiated by the sequence, if it's still running
         if self.recording:
             self.stop_logging(initiated_by='Sequence End')
 
+    def _set_sequence_button_text(self, text):
+        """Updates the sequence button label only when it actually changes."""
+        if self.load_sequence_button.text() != text:
+            self.load_sequence_button.setText(text)
+
     def sequence_onclick(self):
         """Handles the click of the 'Load/Stop Sequence' button."""
         if self.sequence_runner.is_running():
@@ -842,10 +897,32 @@ class App(QMainWindow, QObject):
         else:
             self.gui_updater.update_log('Please connect to the MCU before starting a sequence')
 
+    def _set_input_text(self, line_edit, value):
+        """Writes a numeric value to a line edit, skipping the write if the text is unchanged."""
+        text = f"{value:g}"
+        if line_edit.text() != text:
+            line_edit.setText(text)
+
+    def _queue_input_update(self, line_edit, value):
+        """Records the latest value for an input field and schedules a single batched repaint."""
+        self._pending_input_updates[line_edit] = value
+        if not self.input_update_timer.isActive():
+            self.input_update_timer.start()
+
+    def _flush_pending_input_updates(self):
+        """Applies all queued input updates at once."""
+        pending, self._pending_input_updates = self._pending_input_updates, {}
+        for line_edit, value in pending.items():
+            # The sequence runner already commands the controllers directly; blocking
+            # textChanged keeps the echoed value from being sent to the MCU a second time.
+            blocker = QSignalBlocker(line_edit)
+            self._set_input_text(line_edit, value)
+            blocker.unblock()
+
     def update_flow_rate_input(self, controller_index, rate):
         """Updates the flow rate input field from a sequence event."""
         if 0 <= controller_index < self.num_flow_controllers:
-            self.flow_rate_inputs[controller_index].setText(str(rate))
+            self._queue_input_update(self.flow_rate_inputs[controller_index], rate)
 
     def update_pump_enable_checkbox(self, controller_index, enabled):
         """Updates the pump enable checkbox from a sequence event."""
@@ -853,25 +930,25 @@ class App(QMainWindow, QObject):
             checkbox = self.fc_control_enable[controller_index]
             # Block signals to prevent the checkbox's stateChanged signal from firing,
             # which would cause a redundant command to be sent.
-            checkbox.blockSignals(True)
+            blocker = QSignalBlocker(checkbox)
             checkbox.setChecked(bool(enabled))
-            checkbox.blockSignals(False)
+            blocker.unblock()
             # Force the application to process events to ensure the UI repaints immediately.
             QApplication.processEvents()
 
     def update_temperature_input(self, controller_index, temp):
         """Updates the temperature input field from a sequence event."""
         if 0 <= controller_index < self.num_temp_controllers:
-            self.target_temp_inputs[controller_index].setText(str(temp))
+            self._queue_input_update(self.target_temp_inputs[controller_index], temp)
 
     def update_heater_enable_checkbox(self, controller_index, enabled):
         """Updates the heater enable checkbox from a sequence event."""
         if 0 <= controller_index < self.num_temp_controllers:
             checkbox = self.temp_enable_checkboxes[controller_index]
             # Block signals to prevent the checkbox's stateChanged signal from firing.
-            checkbox.blockSignals(True)
+            blocker = QSignalBlocker(checkbox)
             checkbox.setChecked(bool(enabled))
-            checkbox.blockSignals(False)
+            blocker.unblock()
             # Force the application to process events to ensure the UI repaints immediately.
             QApplication.processEvents()
 
@@ -881,51 +958,54 @@ class App(QMainWindow, QObject):
         if not file_path:
             return
 
-        config = configparser.ConfigParser()
+        payload = {}
 
         # --- Save Flow Controller Settings ---
         for i in range(self.num_flow_controllers):
-            section = f'Flow Controller {i + 1}'
-            config.add_section(section)
-
-            config.set(section, 'flowrate', self.flow_rate_inputs[i].text())
-            config.set(section, 'kp', self.proportional_inputs[i].text())
-            config.set(section, 'ki', self.integral_inputs[i].text())
-            config.set(section, 'kd', self.derivative_inputs[i].text())
-            config.set(section, 'mode', self.flow_controller_dropdowns[i].currentText().lower())
-
             pump_type = self.pump_type_dropdowns[i].currentText().lower()
-            config.set(section, 'pump_type', pump_type)
+            section = {
+                'flowrate': self.flow_rate_inputs[i].text(),
+                'kp': self.proportional_inputs[i].text(),
+                'ki': self.integral_inputs[i].text(),
+                'kd': self.derivative_inputs[i].text(),
+                'mode': self.flow_controller_dropdowns[i].currentText().lower(),
+                'pump_type': pump_type,
+            }
             if pump_type == 'syringe':
-                config.set(section, 'syringe_diameter', self.diameter_inputs[i].text())
-                config.set(section, 'thread_pitch', self.pitch_inputs[i].text())
+                section['syringe_diameter'] = self.diameter_inputs[i].text()
+                section['thread_pitch'] = self.pitch_inputs[i].text()
             elif pump_type == 'peristaltic':
-                config.set(section, 'tube_diameter', self.diameter_inputs[i].text())
-                config.set(section, 'calibration', self.pitch_inputs[i].text())
-
-            config.set(section, 'sensor', 'on' if self.sensor_dropdowns[i].currentText() == 'On' else 'off')
-            config.set(section, 'enable', 'on' if self.fc_control_enable[i].isChecked() else 'off')
-            config.set(section, 'dispense_volume', self.fc_control_volume_inputs[i].text())
-            config.set(section, 'dispense_flowrate', self.fc_control_rate_inputs[i].text())
+                section['tube_diameter'] = self.diameter_inputs[i].text()
+                section['calibration'] = self.pitch_inputs[i].text()
+            section['sensor'] = 'on' if self.sensor_dropdowns[i].currentText() == 'On' else 'off'
+            section['enable'] = 'on' if self.fc_control_enable[i].isChecked() else 'off'
+            section['dispense_volume'] = self.fc_control_volume_inputs[i].text()
+            section['dispense_flowrate'] = self.fc_control_rate_inputs[i].text()
+            payload[f'Flow Controller {i + 1}'] = section
 
         # --- Save Temperature Controller Settings ---
         for i in range(self.num_temp_controllers):
-            section = f'Temp Controller {i + 1}'
-            config.add_section(section)
-            config.set(section, 'target_temp', self.target_temp_inputs[i].text())
-            config.set(section, 'kp', self.temp_proportional_inputs[i].text())
-            config.set(section, 'ki', self.temp_integral_inputs[i].text())
-            config.set(section, 'kd', self.temp_derivative_inputs[i].text())
-            config.set(section, 'sensor', 'on' if self.temp_sensor_dropdowns[i].currentText() == 'On' else 'off')
-            config.set(section, 'enable', 'on' if self.temp_enable_checkboxes[i].isChecked() else 'off')
+            payload[f'Temp Controller {i + 1}'] = {
+                'target_temp': self.target_temp_inputs[i].text(),
+                'kp': self.temp_proportional_inputs[i].text(),
+                'ki': self.temp_integral_inputs[i].text(),
+                'kd': self.temp_derivative_inputs[i].text(),
+                'sensor': 'on' if self.temp_sensor_dropdowns[i].currentText() == 'On' else 'off',
+                'enable': 'on' if self.temp_enable_checkboxes[i].isChecked() else 'off',
+            }
 
         # --- Save DO Sensor Settings ---
-        section = 'DO Sensors'
-        config.add_section(section)
-        config.set(section, 'enable_1', 'on' if self.do_sensor_enables_checkboxes[0].isChecked() else 'off')
-        config.set(section, 'enable_2', 'on' if self.do_sensor_enables_checkboxes[1].isChecked() else 'off')
-        config.set(section, 'fluid', self.do_sensor_fluid_dropdown.currentText().lower())
-        config.set(section, 'units', self.do_sensor_units_dropdown.currentText())
+        payload['DO Sensors'] = {
+            'enable_1': 'on' if self.do_sensor_enables_checkboxes[0].isChecked() else 'off',
+            'enable_2': 'on' if self.do_sensor_enables_checkboxes[1].isChecked() else 'off',
+            'fluid': self.do_sensor_fluid_dropdown.currentText().lower(),
+            'units': self.do_sensor_units_dropdown.currentText(),
+        }
+
+        # Values are plain widget text, so interpolation is disabled and the whole
+        # payload is loaded in one pass instead of one config.set() per option.
+        config = configparser.ConfigParser(interpolation=None)
+        config.read_dict(payload)
 
         try:
             with open(file_path, 'w') as config_file:
@@ -935,17 +1015,25 @@ class App(QMainWindow, QObject):
             self.log_widget.append(f"Error saving configuration: {e}")
     def start_logging(self, filepath, initiated_by='Manual'):
         """Starts saving sensor data to a file."""
-        if self.recording:
-            self.stop_logging()  # Stop previous log first
-
         if not filepath:
             return
+        if self.recording:
+            self.rotate_logging(filepath, initiated_by=initiated_by)
+            return
         if initiated_by == "manual":
             self.log_widget.append(f'{initiated_by} logging started to {filepath}')
         self.start_logging_signal.emit(filepath)
         self.recording = True
         self.save_data_button.setText('Stop Recording')
 
+    def rotate_logging(self, filepath, initiated_by='Manual'):
+        """Switches an active recording to a new file without an intermediate stop."""
+        # DataSaver.start_saving_to_file writes out the running session before
+        # opening the new one, so a single queued signal performs the rotation.
+        self.log_widget.append(f"{initiated_by} logging rotated to {filepath}")
+        self.start_logging_signal.emit(filepath)
+        self.save_data_button.setText('Stop Recording')
+
     def stop_logging(self, initiated_by='Manual'):
         """Stops saving sensor data."""
         if not self.recording:
@@ -979,7 +1067,7 @@ class App(QMainWindow, QObject):
         self.stop_logging(initiated_by='Sequence')
 
     def reset_plot_button_onclick(self):
-        print("Resetting plots and clearing data buffers...")
+        logger.info("Resetting plots and clearing data buffers...")
         self.do_plot_widget.clear()
         self.temp_plot_widget.clear()
         self.flowrate_plot_widget.clear()
@@ -987,7 +1075,7 @@ class App(QMainWindow, QObject):
 
     def closeEvent(self, event):
         """Ensure threads are stopped cleanly on application close."""
-        print("Closing application...")
+        logger.info("Closing application...")
         # Stop sequence runner on its own thread, wait for it to finish
         QMetaObject.invokeMethod(self.sequence_runner, "stop_sequence", Qt.BlockingQueuedConnection)
         self.mcu_disconnect_signal.emit()  # Ensure MCU is disconnected
@@ -995,6 +1083,9 @@ class App(QMainWindow, QObject):
         self.mcu_thread.quit()
         self.mcu_thread.wait()
 
+        self.mcu_parser_thread.quit()
+        self.mcu_parser_thread.wait()
+
         self.sequence_thread.quit()
         self.sequence_thread.wait()
 
@@ -1009,6 +1100,8 @@ class App(QMainWindow, QObject):
 if __name__ == "__main__":
     import sys
 
+    # Debug output of the controller threads (queued commands, controller info) is off unless lowered here
+    logging.basicConfig(level=logging.WARNING)
     app = QApplication(sys.argv)
     window = App()
     window.show()
@@ -1,74 +1,133 @@
+import itertools
+import re
+import sys
 from collections import deque
-from PyQt5.QtCore import QObject, pyqtSignal, QTimer, QIODevice, QByteArray
+from PyQt5.QtCore import QObject, pyqtSignal, pyqtSlot, QTimer, QIODevice
 
 from PyQt5.QtSerialPort import QSerialPort, QSerialPortInfo
 
+__all__ = ['MCUCommands', 'MCUResponse', 'MCUParserWorker', 'MCUWorker']
+
+# Per-field converters of the FLOW ([time, index, flow, ...]) and TEMP ([time, index, temp, duty, ...])
+# payloads, sized for up to 32 lanes
+_FLOW_CAST = (int,) + (int, float) * 32
+_TEMP_CAST = (int,) + (int, float, int) * 32
+# Protocol frame ('$TAG,payload' once ';\n' is stripped): group 1 is the tag, group 2 the payload
+_FRAME_RE = re.compile(rb'\$(OK|ERROR|FLOW|TEMP|DO),(.*)', re.DOTALL)
+
 class MCUCommands:
-    # This class is unchanged
-    def __init__(self):
-        self.com_id_counter = 0
+    # Shared by every command class (flow, temperature, DO), so that com_ids are unique among all the commands
+    # sent to the MCU. next() on itertools.count is atomic, whichever thread builds the command
+    _com_id_counter = itertools.count(1)
     def _generate_com_id(self):
-        self.com_id_counter += 1
-        return f"{self.com_id_counter:04d}"
+        return b'%04d' % next(MCUCommands._com_id_counter)
     def _calculate_checksum(self, command_body):
         return 0
     def _format_command(self, base_command, args):
+        # Commands are built as bytes so that they can be written to the serial port as is
         com_id = self._generate_com_id()
+        command_body = bytearray(base_command)
         if args:
-            command_part = f"{base_command}{','.join(map(str, args))}"
+            command_body += b','.join([str(arg).encode() for arg in args])
         else:
-            command_part = base_command[:-1]
-        command_body = f"{command_part},{com_id},1"
+            del command_body[-1:]
+        command_body += b','
+        command_body += com_id
+        command_body += b',1'
         checksum = self._calculate_checksum(command_body)
-        return f"{command_body};\n", com_id
+        command_body += b';\n'
+        return bytes(command_body), com_id
 
 class MCUResponse(QObject):
-    # This class is unchanged
     ok_signal = pyqtSignal(list)
     error_signal = pyqtSignal(list)
-    flow_data_signal = pyqtSignal(list)
-    temp_data_signal = pyqtSignal(list)
     do_data_signal = pyqtSignal(list)
     info_signal = pyqtSignal(str)
-    OK, ERROR, FLOW, TEMP, DO = '$OK,', '$ERROR,', '$FLOW,', '$TEMP,', '$DO,'
-    def __init__(self):
-        super().__init__()
+    # Frame tags, i.e. the bytes between the leading '$' and the first ','
+    OK, ERROR, FLOW, TEMP, DO = b'OK', b'ERROR', b'FLOW', b'TEMP', b'DO'
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        # Parsed FLOW and TEMP frames are collected here, not emitted one by one; the owner takes them as a batch
+        self.flow_frames = []
+        self.temp_frames = []
+        self._dispatch = {self.FLOW: self._parse_flow, self.TEMP: self._parse_temp, self.DO: self._parse_do,
+                          self.OK: self._parse_ok, self.ERROR: self._parse_error}
     def parse(self, message):
+        # Frames are ASCII, so they are dispatched and converted as bytes (int() and float() accept bytes)
+        # and only decoded when they are forwarded as text.
         try:
-            message_str = message.decode('utf-8').strip(';\n')
-            if not message_str: return
-            if message_str.startswith(self.FLOW):
-            # Handle flow data
-                payload = message_str[len(self.FLOW):].split(',')
-                payload[0] = int(payload[0])  # time in ms
-                for i in range(1, len(payload)):
-                    if i % 2 == 1: payload[i] = int(payload[i])
-                    elif i % 2 == 0: payload[i] = float(payload[i])
-                self.flow_data_signal.emit(payload)
-
-            elif message_str.startswith(self.TEMP):
-            # Handle temperature data
-                payload = message_str[len(self.TEMP):].split(',')
-                payload[0] = int(payload[0])  # time in ms
-                for i in range(1, len(payload)):
-                    if i % 3 == 1: payload[i] = int(payload[i])
-                    elif i % 3 == 2: payload[i] = float(payload[i])
-                    elif i % 3 == 0: payload[i] = int(payload[i])
-                self.temp_data_signal.emit(payload)
-            elif message_str.startswith(self.DO):
-            # Handle DO data
-                payload = message_str[len(self.DO):].split(',')
-                self.do_data_signal.emit([int(payload[0]), float(payload[1]), float(payload[2])])
-
-            elif message_str.startswith(self.OK): self.ok_signal.emit(message_str[len(self.OK):].split(','))
-            elif message_str.startswith(self.ERROR): self.error_signal.emit(message_str[len(self.ERROR):].split(','))
-            else: self.info_signal.emit(message_str)
+            message = message.strip(b';\n')
+            if not message: return
+            if not message.isascii():
+                # Not a protocol frame; forward it as text and replace any bytes that are not valid UTF-8
+                self.info_signal.emit(message.decode('utf-8', errors='replace'))
+                return
+            frame = _FRAME_RE.fullmatch(message)
+            if frame is None: self.info_signal.emit(message.decode('ascii'))
+            else: self._dispatch[frame.group(1)](frame.group(2))
         except Exception as e: self.info_signal.emit(f"Error parsing MCU message: '{message}'. Error: {e}")
 
-class MCUWorker(QObject):
-    # Signals are unchanged
+    def _parse_flow(self, payload):
+        # [time, index_1, flow_1, index_2, flow_2, ...]
+        fields = payload.split(b',')
+        # zip() would silently drop the fields past the end of the table
+        if len(fields) > len(_FLOW_CAST): raise ValueError(f"too many fields ({len(fields)})")
+        self.flow_frames.append([cast(field) for cast, field in zip(_FLOW_CAST, fields)])
+
+    def _parse_temp(self, payload):
+        # [time, index_1, temp_1, duty_1, ...]
+        fields = payload.split(b',')
+        if len(fields) > len(_TEMP_CAST): raise ValueError(f"too many fields ({len(fields)})")
+        self.temp_frames.append([cast(field) for cast, field in zip(_TEMP_CAST, fields)])
+
+    def _parse_do(self, payload):
+        # Always [time, voltage_1, voltage_2]: the two commas are located directly instead of splitting
+        c1 = payload.find(b',')
+        c2 = payload.find(b',', c1 + 1)
+        if c2 == -1: raise ValueError("expected 3 fields")
+        self.do_data_signal.emit([int(payload[:c1]), float(payload[c1 + 1:c2]), float(payload[c2 + 1:])])
+
+    def _parse_ok(self, payload):
+        # Kept as bytes so that the com_id compares directly with the one returned by _format_command
+        self.ok_signal.emit(payload.split(b','))
+
+    def _parse_error(self, payload):
+        self.error_signal.emit(payload.decode('ascii').split(','))
+
+class MCUParserWorker(QObject):
+    """
+    Parses the raw frames that MCUWorker pushes onto a shared queue.
+    It is intended to be moved to its own QThread so that parsing never delays reading the serial port.
+    """
+    # Flow and temperature frames are emitted in batches: one list of frames per drained queue
     flow_data_received = pyqtSignal(list)
     temp_data_received = pyqtSignal(list)
+
+    def __init__(self, frame_queue):
+        super().__init__()
+        # Single producer (MCUWorker.read_message) / single consumer (drain): deque append and
+        # popleft are atomic, so no lock is needed
+        self.frame_queue = frame_queue
+        # Child of the worker, so that it follows it to the parser thread
+        self.parser = MCUResponse(self)
+
+    @pyqtSlot()
+    def drain(self):
+        while True:
+            try: message = self.frame_queue.popleft()
+            except IndexError: break
+            try: self.parser.parse(message)
+            except Exception as e: self.parser.info_signal.emit(f"Error during message parsing: {e}")
+        # Fresh lists are started because queued receivers get a reference to the emitted list, not a copy
+        if self.parser.flow_frames:
+            self.flow_data_received.emit(self.parser.flow_frames)
+            self.parser.flow_frames = []
+        if self.parser.temp_frames:
+            self.temp_data_received.emit(self.parser.temp_frames)
+            self.parser.temp_frames = []
+
+class MCUWorker(QObject):
+    frames_ready = pyqtSignal()
     do_data_received = pyqtSignal(list)
     ack_received = pyqtSignal(list)
     error_received = pyqtSignal(list)
@@ -78,18 +137,22 @@ class MCUWorker(QObject):
     def __init__(self):
         super().__init__()
         self.mcu = None
-        self.ack_timer = None
         self.connected = False
         self.commands = MCUCommands()
-        self.parser = MCUResponse()
         self.command_queue = deque()
-        self.waiting_for_com_id = None
-        self.serial_buffer = QByteArray()
+        # Commands written to the MCU and still waiting for their ACK, keyed by com_id -> ack timeout timer
+        self._inflight = {}
+        self.command_window = 4  # maximum number of commands awaiting an ACK at once
+        self.serial_buffer = bytearray()
         self.ack_timeout = 500  # milliseconds
+        # Complete frames waiting to be parsed; the oldest are dropped if the parser falls this far behind
+        self.frame_queue = deque(maxlen=4096)
+        # The parser worker has no parent so that it can be moved to its own thread
+        self.parser_worker = MCUParserWorker(self.frame_queue)
+        self.parser = self.parser_worker.parser
+        self.frames_ready.connect(self.parser_worker.drain)
 
         # Connect the parser's signals
-        self.parser.flow_data_signal.connect(self.flow_data_received)
-        self.parser.temp_data_signal.connect(self.temp_data_received)
         self.parser.do_data_signal.connect(self.do_data_received)
         self.parser.error_signal.connect(self.error_received)
         self.parser.info_signal.connect(self.log_signal)
@@ -97,77 +160,118 @@ class MCUWorker(QObject):
         self.parser.ok_signal.connect(self._handle_mcu_ack)
 
     def _process_queue(self):
-        if self.waiting_for_com_id is None and self.command_queue:
+        # Every command that fits in the window is sent in a single write
+        outgoing = []
+        while self.command_queue and len(self._inflight) < self.command_window:
             command, com_id = self.command_queue.popleft()
-            if self.connected and self.mcu:
-                self.waiting_for_com_id = com_id
-                self.mcu.write(command.encode())
-                self.ack_timer.start(self.ack_timeout)
-            else:
-                self.log_signal.emit(f"Command {com_id} dropped: MCU not connected.")
+            if com_id in self._inflight:
+                # Never have two commands with the same com_id awaiting an ACK; wait for the first one to clear
+                self.command_queue.appendleft((command, com_id))
+                break
+            if not (self.connected and self.mcu):
+                self.log_signal.emit(f"Command {com_id.decode()} dropped: MCU not connected.")
+                continue
+            ack_timer = QTimer(self)
+            ack_timer.setSingleShot(True)
+            ack_timer.timeout.connect(lambda com_id=com_id: self._handle_ack_timeout(com_id))
+            self._inflight[com_id] = ack_timer
+            outgoing.append(command)
+            ack_timer.start(self.ack_timeout)
+        if outgoing:
+            self.mcu.write(b''.join(outgoing))
 
+    # Must stay a decorated slot: it is connected in __init__, before the worker is moved to the MCU thread,
+    # and only a decorated slot is then invoked in the thread the worker lives in when the ACK arrives
+    @pyqtSlot(list)
     def _handle_mcu_ack(self, payload):
         if not payload: return
-        ack_com_id = payload[0]
-        if ack_com_id == self.waiting_for_com_id:
-            self.ack_timer.stop()
-            # --- FIX: Corrected the debug print statement ---
-            self.waiting_for_com_id = None
-            # Process the next command in the queue
-            # Single shot timer is used so that process is called after the ack_timer has fully stopped
-            QTimer.singleShot(0, self._process_queue)
-
-    def _handle_ack_timeout(self):
-        if self.waiting_for_com_id is not None:
-            timed_out_id = self.waiting_for_com_id
-            self.waiting_for_com_id = None
-            self.log_signal.emit(f"Timeout: No ACK received for command {timed_out_id}. Moving on.")
-            self._process_queue()
+        ack_timer = self._inflight.pop(payload[0], None)
+        if ack_timer is None: return
+        ack_timer.stop()
+        ack_timer.deleteLater()
+        # A slot in the window was freed, send the next queued command right away
+        self._process_queue()
+
+    def _handle_ack_timeout(self, com_id):
+        ack_timer = self._inflight.pop(com_id, None)
+        if ack_timer is None: return
+        ack_timer.deleteLater()
+        self.log_signal.emit(f"Timeout: No ACK received for command {com_id.decode()}. Moving on.")
+        self._process_queue()
 
     def read_message(self):
         if not self.mcu: return
-        incoming_data = self.mcu.readAll()
-        self.serial_buffer.append(incoming_data)
-        while True:
-            end_of_message_pos = self.serial_buffer.indexOf(b';\n')
-            if end_of_message_pos == -1: break
-            message_length = end_of_message_pos + 2
-            message = self.serial_buffer.left(message_length)
-            self.serial_buffer = self.serial_buffer.mid(message_length)
-            try: self.parser.parse(bytes(message))
-            except Exception as e: self.log_signal.emit(f"Error during message parsing: {e}")
+        self.serial_buffer += self.mcu.readAll().data()
+        # Frames are sliced out by offset and the consumed bytes are dropped once per read,
+        # rather than reallocating the remaining buffer after every frame
+        # Only framing happens here; parsing is handed to the parser worker's thread, so each frame is
+        # copied once (through a memoryview slice) instead of being passed as a view of this buffer
+        start = 0
+        with memoryview(self.serial_buffer) as view:  # released before the buffer is resized
+            while True:
+                end_of_message_pos = self.serial_buffer.find(b';\n', start)
+                if end_of_message_pos == -1: break
+                message_end = end_of_message_pos + 2
+                self.frame_queue.append(bytes(view[start:message_end]))
+                start = message_end
+        if start:
+            del self.serial_buffer[:start]
+            self.frames_ready.emit()
 
+    @pyqtSlot(bytes, bytes)
     def submit_command(self, command, com_id):
         self.command_queue.append((command, com_id))
         self._process_queue()
 
+    @pyqtSlot(list)
+    def submit_commands(self, commands):
+        # commands is a list of (command, com_id) tuples, queued in order
+        self.command_queue.extend(commands)
+        self._process_queue()
+
     def connect_mcu(self):
         if self.connected: return
-        self.ack_timer = QTimer()
-        self.ack_timer.setSingleShot(True)
-        self.ack_timer.timeout.connect(self._handle_ack_timeout)
-        serial_port_info = QSerialPortInfo.availablePorts()
-        for port in serial_port_info:
-            if "USB Serial Device" in port.description():
-                self.mcu = QSerialPort()
-                self.mcu.setPortName(port.portName())
-                self.mcu.setBaudRate(QSerialPort.Baud115200)
-                if self.mcu.open(QIODevice.ReadWrite):
-                    self.connected = True
-                    self.mcu.readyRead.connect(self.read_message)
-                    self.log_signal.emit(f"Connection to MCU successful on {port.portName()}")
-                    self.connected_signal.emit(True)
-                    return
-                else: self.log_signal.emit(f"Failed to open port {port.portName()}: {self.mcu.errorString()}")
+        for port in QSerialPortInfo.availablePorts():
+            if "USB Serial Device" not in port.description(): continue
+            serial_port = QSerialPort(port)
+            serial_port.setBaudRate(QSerialPort.Baud115200)
+            if serial_port.open(QIODevice.ReadWrite):
+                self.mcu = serial_port
+                self.connected = True
+                self._enable_low_latency()
+                self.mcu.readyRead.connect(self.read_message)
+                self.log_signal.emit(f"Connection to MCU successful on {port.portName()}")
+                self.connected_signal.emit(True)
+                return
+            # Discard the unopened port instead of leaving it behind as self.mcu
+            self.log_signal.emit(f"Failed to open port {port.portName()}: {serial_port.errorString()}")
+            serial_port.deleteLater()
         self.log_signal.emit("No MCU connected")
         self.connected_signal.emit(False)
 
+    def _enable_low_latency(self):
+        # The Linux serial driver may hold received bytes for a few ms before waking the reader;
+        # ASYNC_LOW_LATENCY asks it to push them right away (same approach as pyserial's low_latency_mode)
+        if not sys.platform.startswith('linux'): return
+        import array, fcntl, termios
+        try:
+            serial_info = array.array('i', [0] * 32)
+            fcntl.ioctl(self.mcu.handle(), termios.TIOCGSERIAL, serial_info)
+            serial_info[4] |= 0x2000  # flags |= ASYNC_LOW_LATENCY
+            fcntl.ioctl(self.mcu.handle(), termios.TIOCSSERIAL, serial_info)
+        except (OSError, AttributeError) as e:
+            # Not every driver supports it (e.g. some USB CDC devices); the port works regardless
+            self.log_signal.emit(f"Low latency mode not available on {self.mcu.portName()}: {e}")
+
     def disconnect_mcu(self):
         if self.mcu and self.mcu.isOpen(): self.mcu.close()
-        if self.ack_timer: self.ack_timer.stop()
+        for ack_timer in self._inflight.values():
+            ack_timer.stop()
+            ack_timer.deleteLater()
+        self._inflight.clear()
         self.connected = False
         self.serial_buffer.clear()
+        self.frame_queue.clear()
         self.command_queue.clear()
-        self.waiting_for_com_id = None
         self.connected_signal.emit(False)
         self.log_signal.emit("Disconnected from MCU")
\ No newline at end of file
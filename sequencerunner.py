@@ -1,5 +1,15 @@
+import os
+from collections import OrderedDict
 from PyQt5.QtCore import QObject, pyqtSignal, QTimer, pyqtSlot
-import toml
+
+
+def _import_toml():
+    # Imported on the first sequence load rather than at startup, since most sessions never run a sequence
+    try:
+        import tomllib
+    except ImportError:  # Python < 3.11, same parser from PyPI
+        import tomli as tomllib
+    return tomllib
 
 
 class SequenceRunner(QObject):
@@ -21,29 +31,146 @@ class SequenceRunner(QObject):
     sequence_finished_signal = pyqtSignal()
     sequence_started_signal = pyqtSignal()
 
+    # Parameters required by each event type, in the order they are passed to the event's signal
+    REQUIRED = {
+        'delay': ('duration_s',),
+        'set_flow_rate': ('controller', 'rate'),
+        'enable_pump': ('controller', 'enabled'),
+        'set_temperature': ('controller', 'temp'),
+        'enable_heater': ('controller', 'enabled'),
+        'dispense_volume': ('controller', 'volume', 'flowrate'),
+        'start_logging': ('filepath',),
+        'stop_logging': (),
+    }
+    # Expected type of each parameter, with its description for error messages. bool is an int subclass,
+    # so it is rejected explicitly wherever a number is expected
+    PARAMETER_TYPES = {
+        'controller': (int, 'an integer'),
+        'rate': ((int, float), 'a number'),
+        'temp': ((int, float), 'a number'),
+        'volume': ((int, float), 'a number'),
+        'flowrate': ((int, float), 'a number'),
+        'duration_s': ((int, float), 'a number'),
+        'enabled': (bool, 'true or false'),
+        'filepath': (str, 'a string'),
+    }
+    MAX_DELAY_S = (2 ** 31 - 1) / 1000  # QTimer intervals are signed 32-bit milliseconds
+    # Events without a delay run back to back; the runner yields to its event loop after this many of them
+    # so that a stop request still gets through during long runs of such events
+    STEPS_PER_YIELD = 64
+
     def __init__(self):
         super().__init__()
         self.sequence = []
+        # self.sequence resolved into one (step message, operation, argument) tuple per event
+        self._compiled = []
         self.current_step = -1
         self._is_stopped = True
+        # Parsed sequences keyed by (absolute path, mtime, size), so rerunning an unchanged file skips parsing
+        self._sequence_cache = OrderedDict()
+        self.sequence_cache_size = 8
 
         self.delay_timer = QTimer(self)
         self.delay_timer.setSingleShot(True)
         self.delay_timer.timeout.connect(self._process_next_step)
+        # Resumes a long run of non-delay events from the event loop; reused rather than a new singleShot each time
+        self._next_timer = QTimer(self)
+        self._next_timer.setSingleShot(True)
+        self._next_timer.setInterval(0)
+        self._next_timer.timeout.connect(self._process_next_step)
 
     def _load_sequence_from_file(self, sequence_file):
         """Loads sequence from a file. Returns True on success."""
+        tomllib = _import_toml()
         try:
-            with open(sequence_file, 'r') as f:
-                sequence_data = toml.load(f)
-                self.sequence = sequence_data.get('event', [])
+            file_stat = os.stat(sequence_file)
+            cache_key = (os.path.abspath(sequence_file), file_stat.st_mtime_ns, file_stat.st_size)
+            if cache_key in self._sequence_cache:
+                self._sequence_cache.move_to_end(cache_key)
+                self.sequence, self._compiled = self._sequence_cache[cache_key]
+                self.log_signal.emit(f"Sequence loaded from {sequence_file} (unchanged since last load)")
+                return True
+            # The whole file is read in one call and parsed from memory
+            with open(sequence_file, 'rb') as f:
+                raw = f.read()
+            sequence_data = tomllib.loads(raw.decode('utf-8'))
+            self.sequence = sequence_data.get('event', [])
+            errors = self._validate_sequence(self.sequence)
+            if errors:
+                for error in errors:
+                    self.log_signal.emit(f"Error in sequence file: {error}")
+                self.sequence = []
+                self._compiled = []
+                return False
+            self._compiled = self._compile_sequence(self.sequence)
+            self._sequence_cache[cache_key] = (self.sequence, self._compiled)
+            if len(self._sequence_cache) > self.sequence_cache_size:
+                self._sequence_cache.popitem(last=False)  # least recently loaded
             self.log_signal.emit(f"Sequence loaded from {sequence_file}")
             return True
-        except (toml.TomlDecodeError, FileNotFoundError) as e:
+        except (tomllib.TOMLDecodeError, UnicodeDecodeError, FileNotFoundError) as e:
             self.log_signal.emit(f"Error loading sequence file: {e}")
             self.sequence = []
+            self._compiled = []
             return False
 
+    def _validate_sequence(self, events):
+        """
+        Checks every event against REQUIRED and PARAMETER_TYPES.
+        Returns the list of problems found, empty if the sequence is valid.
+        """
+        if not isinstance(events, list):
+            return ["'event' must be an array of tables."]
+        errors = []
+        for step, event in enumerate(events, start=1):
+            if not isinstance(event, dict):
+                errors.append(f"Step {step} is not a table.")
+                continue
+            event_type = event.get('type')
+            required = self.REQUIRED.get(event_type, ())
+            missing = [key for key in required if key not in event]
+            if missing:
+                errors.append(f"Step {step} ({event_type}) is missing parameter(s): {', '.join(missing)}")
+            for key in required:
+                if key not in event:
+                    continue
+                value = event[key]
+                expected, description = self.PARAMETER_TYPES[key]
+                if isinstance(value, bool) != (expected is bool) or not isinstance(value, expected):
+                    errors.append(f"Step {step} ({event_type}): '{key}' must be {description}, not {value!r}")
+                elif key == 'duration_s' and not 0 <= value <= self.MAX_DELAY_S:
+                    # Also rejects nan and inf, which TOML allows
+                    errors.append(f"Step {step} ({event_type}): 'duration_s' must be between 0 and "
+                                  f"{self.MAX_DELAY_S:.0f}, not {value!r}")
+        return errors
+
+    def _compile_sequence(self, events):
+        """
+        Resolves each validated event into the signal to emit and its arguments, so that running a step
+        needs no type comparison or parameter lookup.
+        """
+        emitters = {
+            'set_flow_rate': self.set_flow_rate_signal.emit,
+            'enable_pump': self.enable_pump_signal.emit,
+            'set_temperature': self.set_temperature_signal.emit,
+            'enable_heater': self.enable_heater_signal.emit,
+            'dispense_volume': self.dispense_volume_signal.emit,
+            'start_logging': self.start_logging_signal.emit,
+            'stop_logging': self.stop_logging_signal.emit,
+        }
+        compiled = []
+        for step, event in enumerate(events, start=1):
+            message = f"Executing step {step}: {event}"
+            event_type = event.get('type')
+            if event_type == 'delay':
+                compiled.append((message, 'delay', int(event['duration_s'] * 1000)))
+            elif event_type in emitters:
+                arguments = tuple(event[key] for key in self.REQUIRED[event_type])
+                compiled.append((message, emitters[event_type], arguments))
+            else:
+                compiled.append((message, 'log', f"Unknown event type: {event_type}"))
+        return compiled
+
     @pyqtSlot(str)
     def load_and_start_sequence(self, sequence_file):
         """Public slot to be called from the main thread to load and start a sequence."""
@@ -64,6 +191,7 @@ class SequenceRunner(QObject):
             self._is_stopped = True
             if self.delay_timer.isActive():
                 self.delay_timer.stop()
+            self._next_timer.stop()
             self.log_signal.emit("Sequence stopped by user.")
             self.sequence_finished_signal.emit()  # Signal that it's done
 
@@ -72,49 +200,28 @@ class SequenceRunner(QObject):
         return not self._is_stopped
 
     def _process_next_step(self):
-        """Processes the next event in the sequence."""
-        if self._is_stopped:
-            return
-
-        self.current_step += 1
-        if self.current_step >= len(self.sequence):
-            self.log_signal.emit("Sequence finished.")
-            self._is_stopped = True
-            self.sequence_finished_signal.emit()
-            return
-
-        event = self.sequence[self.current_step]
-        self.log_signal.emit(f"Executing step {self.current_step + 1}: {event}")
+        """Processes the next events in the sequence, until a delay or the end of the sequence."""
+        steps = 0
+        while not self._is_stopped:
+            self.current_step += 1
+            if self.current_step >= len(self.sequence):
+                self.log_signal.emit("Sequence finished.")
+                self._is_stopped = True
+                self.sequence_finished_signal.emit()
+                return
 
-        try:
-            event_type = event.get('type')
-            if event_type == 'delay':
-                duration_ms = int(event['duration_s'] * 1000)
-                self.delay_timer.start(duration_ms)
+            message, operation, argument = self._compiled[self.current_step]
+            self.log_signal.emit(message)
+            if operation == 'delay':
+                self.delay_timer.start(argument)
                 return  # Stop processing here; timer will trigger the next step
-
-            elif event_type == 'set_flow_rate':
-                self.set_flow_rate_signal.emit(event['controller'], event['rate'])
-            elif event_type == 'enable_pump':
-                self.enable_pump_signal.emit(event['controller'], event['enabled'])
-            elif event_type == 'set_temperature':
-                self.set_temperature_signal.emit(event['controller'], event['temp'])
-            elif event_type == 'enable_heater':
-                self.enable_heater_signal.emit(event['controller'], event['enabled'])
-            elif event_type == 'dispense_volume':
-                self.dispense_volume_signal.emit(event['controller'], event['volume'], event['flowrate'])
-            elif event_type == 'start_logging':
-                self.start_logging_signal.emit(event['filepath'])
-            elif event_type == 'stop_logging':
-                self.stop_logging_signal.emit()
+            elif operation == 'log':
+                self.log_signal.emit(argument)
             else:
-                self.log_signal.emit(f"Unknown event type: {event_type}")
-
-        except KeyError as e:
-            self.log_widget.append(f"Error in sequence step {event}: Missing parameter {e}")
-            self.stop_sequence()
-            return
-
-        # For non-delay events, trigger the next step immediately via the event loop
-        QTimer.singleShot(0, self._process_next_step)
+                operation(*argument)
 
+            steps += 1
+            if steps == self.STEPS_PER_YIELD:
+                # Resume from the event loop rather than calling processEvents(), which could re-enter this slot
+                self._next_timer.start()
+                return
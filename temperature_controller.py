@@ -1,56 +1,75 @@
+import logging
 import time
 
-from PyQt5.QtCore import QThread, pyqtSignal, QObject
+import numpy as np
+from PyQt5.QtCore import QThread, pyqtSignal, QObject, QTimer
 from mcu import MCUCommands
-from collections import deque
+
+logger = logging.getLogger(__name__)
 
 
 class TemperatureControllerCommands(MCUCommands):
     # Temperature Controller Commands
-    TEMP_START = '$TEMPCTRL,START,'
-    TEMP_STOP = '$TEMPCTRL,STOP,'
-    TEMP_SET_TEMP = '$TEMPCTRL,SET_TEMP,'
-    TEMP_SSR_ENABLE = '$TEMPCTRL,SSR_ENABLE,'
-    TEMP_SSR_DISABLE = '$TEMPCTRL,SSR_DISABLE,'
-    TEMP_SET_PID = '$TEMPCTRL,SET_PID_SETTINGS,'
-    TEMP_INFO = '$TEMPCTRL,INFO,'
-    TEMP_HELP = '$TEMPCTRL,HELP,'
-    TEMP_CONT_TEMP_ON = '$TEMPCTRL,CONT_TEMP_ON,'
-    TEMP_CONT_TEMP_OFF = '$TEMPCTRL,CONT_TEMP_OFF,'
+    TEMP_START = b'$TEMPCTRL,START,'
+    TEMP_STOP = b'$TEMPCTRL,STOP,'
+    TEMP_SET_TEMP = b'$TEMPCTRL,SET_TEMP,'
+    TEMP_SSR_ENABLE = b'$TEMPCTRL,SSR_ENABLE,'
+    TEMP_SSR_DISABLE = b'$TEMPCTRL,SSR_DISABLE,'
+    TEMP_SET_PID = b'$TEMPCTRL,SET_PID_SETTINGS,'
+    TEMP_INFO = b'$TEMPCTRL,INFO,'
+    TEMP_HELP = b'$TEMPCTRL,HELP,'
+    TEMP_CONT_TEMP_ON = b'$TEMPCTRL,CONT_TEMP_ON,'
+    TEMP_CONT_TEMP_OFF = b'$TEMPCTRL,CONT_TEMP_OFF,'
+
+    # Commands that address controllers through a targets bitmask
+    _CMD_TABLE = {
+        'start': TEMP_START,
+        'stop': TEMP_STOP,
+        'set_temp': TEMP_SET_TEMP,
+        'ssr_enable': TEMP_SSR_ENABLE,
+        'ssr_disable': TEMP_SSR_DISABLE,
+        'set_pid': TEMP_SET_PID,
+        'info': TEMP_INFO,
+    }
+
+    def _check_targets(self, targets):
+        if targets & ~0b11:  # any bit outside the two controllers, negative numbers included
+            raise ValueError("Targets must be an integer between 0 and 3.")
+
+    def _targeted_command(self, key, targets, *args):
+        """Formats the command of _CMD_TABLE[key] for the controllers selected by the targets bitmask."""
+        self._check_targets(targets)
+        return self._format_command(self._CMD_TABLE[key], [targets, *args])
 
     # ----- Temperature Controller Methods -----
     def temp_start_stop(self, targets, start=True):
         """Starts or stops temperature controllers."""
-        if not (0 <= targets <= 3):
-            raise ValueError("Targets must be an integer between 0 and 3.")
-        base_command = self.TEMP_START if start else self.TEMP_STOP
-        return self._format_command(base_command, [targets])
+        return self._targeted_command('start' if start else 'stop', targets)
 
     def temp_ssr_enable_disable(self, targets, enable=True):
         """Enables or disables continuous temperature readings."""
-        if not (0 <= targets <= 3):
-            raise ValueError("Targets must be an integer between 0 and 3.")
-        base_command = self.TEMP_SSR_ENABLE if enable else self.TEMP_SSR_DISABLE
-        return self._format_command(base_command, [targets])
+        return self._targeted_command('ssr_enable' if enable else 'ssr_disable', targets)
 
     def temp_set_temp(self, targets, temperature):
         """Sets the target temperature."""
-        if not (0 <= targets <= 3):
-            raise ValueError("Targets must be an integer between 0 and 3.")
-        return self._format_command(self.TEMP_SET_TEMP, [targets, temperature])
+        return self._targeted_command('set_temp', targets, temperature)
+
+    def temp_set_temp_prefix(self, targets):
+        """Builds the SET_TEMP command prefix of the given targets, to be reused with temp_set_temp_prefixed."""
+        self._check_targets(targets)
+        return self.TEMP_SET_TEMP + b'%d,' % targets
+
+    def temp_set_temp_prefixed(self, prefix, temperature):
+        """Sets the target temperature, using a prefix built by temp_set_temp_prefix."""
+        return self._format_command(prefix, [temperature])
 
     def temp_set_pid(self, targets, kp, ki, kd):
         """Sets the PID gains for temperature controllers."""
-        if not (0 <= targets <= 3):
-            raise ValueError("Targets must be an integer between 0 and 3.")
-        args = [targets, kp, ki, kd]
-        return self._format_command(self.TEMP_SET_PID, args)
+        return self._targeted_command('set_pid', targets, kp, ki, kd)
 
     def temp_info(self, targets):
         """Requests information from the temperature controllers."""
-        if not (0 <= targets <= 3):
-            raise ValueError("Targets must be an integer between 0 and 3.")
-        return self._format_command(self.TEMP_INFO, [targets])
+        return self._targeted_command('info', targets)
 
     def temp_help(self):
         """Requests help information from the temperature controllers."""
@@ -63,8 +82,8 @@ class TemperatureControllerCommands(MCUCommands):
 
 
 class TemperatureControllerThread(QThread):
-    # Signal now emits the command string and its unique communication ID
-    mcu_signal = pyqtSignal(str, str)
+    # Signal emits the command bytes and their unique communication ID
+    mcu_signal = pyqtSignal(bytes, bytes)
     update_plot_signal = pyqtSignal()  # Signal containing data to be logged and plotted
     update_temperature_signal = pyqtSignal(list)
     commands = TemperatureControllerCommands()
@@ -74,9 +93,21 @@ class TemperatureControllerThread(QThread):
         self.num_temp_controllers = 2  # Number of temperature controllers
         self.temperature_controllers = []
         self.continuous_reading = False
+        # The plot is refreshed at most once every plot_interval_ms (~30 Hz); the data arriving in between is
+        # shown by a single trailing refresh
+        self.plot_interval_ms = 33
+        self._last_plot_time = 0.0
+        self._plot_timer = QTimer(self)
+        self._plot_timer.setSingleShot(True)
+        self._plot_timer.timeout.connect(self._emit_plot_update)
 
         for i in range(self.num_temp_controllers):
             self.temperature_controllers.append(temperature_controller(f"TempCtrl_{i}", 2**i))
+        # Controllers by the index reported in the serial data
+        self._by_num = {controller.num: controller for controller in self.temperature_controllers}
+        # SET_TEMP command prefixes ('$TEMPCTRL,SET_TEMP,<target>,'), built once per controller
+        self._set_temp_prefix = [self.commands.temp_set_temp_prefix(controller.num)
+                                 for controller in self.temperature_controllers]
 
     def set_temperature(self, temp_controller_num, temperature):
         if self.temperature_controllers[temp_controller_num].temperature_limits[0] <= temperature <= self.temperature_controllers[temp_controller_num].temperature_limits[1]:
@@ -84,9 +115,9 @@ class TemperatureControllerThread(QThread):
             pass
         if 0 <= temp_controller_num < self.num_temp_controllers:
             self.temperature_controllers[temp_controller_num].set_temperature(temperature)
-            target = self.temperature_controllers[temp_controller_num].num
-            command, com_id = self.commands.temp_set_temp(target, self.temperature_controllers[temp_controller_num].temperature)
-                #print(f"TC Thread: Queuing command {com_id}")
+            command, com_id = self.commands.temp_set_temp_prefixed(self._set_temp_prefix[temp_controller_num],
+                                                                   self.temperature_controllers[temp_controller_num].temperature)
+            logger.debug("TC Thread: Queuing command %s", com_id)
             self.mcu_signal.emit(command, com_id)
         else:
             raise ValueError("Invalid temperature controller number.")
@@ -96,7 +127,7 @@ class TemperatureControllerThread(QThread):
             self.temperature_controllers[temp_controller_num].set_enable(enable)
             target = self.temperature_controllers[temp_controller_num].num
             command, com_id = self.commands.temp_start_stop(target, enable)
-                #print(f"TC Thread: Queuing command {com_id}")
+            logger.debug("TC Thread: Queuing command %s", com_id)
             self.mcu_signal.emit(command, com_id)
         else:
             raise ValueError("Invalid temperature controller number.")
@@ -109,7 +140,7 @@ class TemperatureControllerThread(QThread):
                                                 self.temperature_controllers[temp_controller_num].kp,
                                                 self.temperature_controllers[temp_controller_num].ki,
                                                 self.temperature_controllers[temp_controller_num].kd)
-                #print(f"TC Thread: Queuing command {com_id}")
+            logger.debug("TC Thread: Queuing command %s", com_id)
             self.mcu_signal.emit(command, com_id)
         else:
             raise ValueError("Invalid temperature controller number.")
@@ -119,7 +150,7 @@ class TemperatureControllerThread(QThread):
             self.temperature_controllers[temp_controller_num].set_sensor(sensor)
             target = self.temperature_controllers[temp_controller_num].num
             command, com_id = self.commands.temp_ssr_enable_disable(target, sensor)
-                #print(f"TC Thread: Queuing command {com_id}")
+            logger.debug("TC Thread: Queuing command %s", com_id)
             self.mcu_signal.emit(command, com_id)
         else:
             raise ValueError("Invalid temperature controller number.")
@@ -128,40 +159,54 @@ class TemperatureControllerThread(QThread):
         if enable != self.continuous_reading:
             self.continuous_reading = enable
             command, com_id = self.commands.continuous_read(on=enable)
-                #print(f"TC Thread: Queuing command {com_id}")
+            logger.debug("TC Thread: Queuing command %s", com_id)
             self.mcu_signal.emit(command, com_id)
 
-    def process_temp_serial_data(self, data: list):
-        # Process the incoming temperature controller data
-        # Data format: [time_ms, index_1, temp_1, duty_1, ...] depending on number of controllers that are enabled
-        # parse data into two lists for each controller
+    def process_temp_serial_batch(self, frames: list):
+        # Process all the temperature frames received in one serial read.
+        # Frame format: [time_ms, index_1, temp_1, duty_1, ...] depending on number of controllers that are enabled
+        # The plot is refreshed once and the DO sensors receive the latest temperatures.
+        last_do_sensor_temp = None
+        for data in frames:
+            do_sensor_temp = self._add_temp_frame(data)
+            if do_sensor_temp is not None:
+                last_do_sensor_temp = do_sensor_temp
+        if last_do_sensor_temp is not None:
+            self._request_plot_update()
+            self.update_temperature_signal.emit(last_do_sensor_temp)
+
+    def _request_plot_update(self):
+        if self._plot_timer.isActive():
+            return  # a refresh is already scheduled and will include this data
+        elapsed_ms = (time.monotonic() - self._last_plot_time) * 1000.0
+        if elapsed_ms >= self.plot_interval_ms:
+            self._emit_plot_update()
+        else:
+            self._plot_timer.start(int(self.plot_interval_ms - elapsed_ms) + 1)
 
-        # Ex
-        #get the indexes of the enabled controllers from data
-        data_length = len(data)
-        num_controllers_in_data = (data_length - 1) // 3
+    def _emit_plot_update(self):
+        self._last_plot_time = time.monotonic()
+        self.update_plot_signal.emit()
+
+    def _add_temp_frame(self, data: list):
+        # Adds one temperature frame to the controller buffers.
+        # Returns the [index, temp, ...] list for the DO sensors, or None if no enabled sensor got new data.
         new_data = False
         do_sensor_temp = []
-        for i in range(num_controllers_in_data):
-            index = data[1 + i * 3]
-            temp = data[2 + i * 3]
-            duty = data[3 + i * 3]
+        # zip() walks the (index, temp, duty) lanes together and drops an incomplete trailing group
+        for index, temp, duty in zip(data[1::3], data[2::3], data[3::3]):
             do_sensor_temp.append(index)
             do_sensor_temp.append(temp)
-            for controller in self.temperature_controllers:
-                if controller.num == index and controller.sensor:
-                    new_data = True
-                    controller.add_data(data[0], temp)
-                    controller.current_dutycycle_percent = (duty / controller.max_dutycycle) * 100.0
-                    break
-        if new_data:
-            self.update_plot_signal.emit()
-            self.update_temperature_signal.emit(do_sensor_temp)
+            controller = self._by_num.get(index)
+            if controller is not None and controller.sensor:
+                new_data = True
+                controller.add_data(data[0], temp)
+                controller.current_dutycycle_percent = (duty / controller.max_dutycycle) * 100.0
+        return do_sensor_temp if new_data else None
 
     def clear_buffers(self):
         for controller in self.temperature_controllers:
-            controller.temp_buffer.clear()
-            controller.time_buffer.clear()
+            controller.clear_buffers()
 
 class temperature_controller:
     def __init__(self, name, number):
@@ -176,8 +221,12 @@ class temperature_controller:
         self.max_dutycycle = 65535  # max heater duty cycle
         self.current_dutycycle_percent = 0
         self.buffer_size = 10000
-        self.temp_buffer = deque(maxlen=self.buffer_size)
-        self.time_buffer = deque(maxlen=self.buffer_size)
+        # Ring buffers holding the last buffer_size samples. Each sample is written twice, buffer_size apart,
+        # so that the buffered samples are always one contiguous slice (see get_view)
+        self.time_buffer = np.empty(2 * self.buffer_size)
+        self.temp_buffer = np.empty(2 * self.buffer_size)
+        self._write_index = 0
+        self._count = 0
         self.temperature_limits = (0, 40.0)  # min and max temperature limits
 
     def set_enable(self, enable):
@@ -201,5 +250,22 @@ class temperature_controller:
         return ms / 1000.0
 
     def add_data(self, time_ms: int, temperature: float):
-        self.time_buffer.append(self.ms_to_elaspsed_seconds(time_ms))
-        self.temp_buffer.append(temperature)
\ No newline at end of file
+        i = self._write_index
+        self.time_buffer[i] = self.time_buffer[i + self.buffer_size] = self.ms_to_elaspsed_seconds(time_ms)
+        self.temp_buffer[i] = self.temp_buffer[i + self.buffer_size] = temperature
+        self._write_index = (i + 1) % self.buffer_size
+        if self._count < self.buffer_size:
+            self._count += 1
+
+    def get_view(self):
+        """
+        Returns (time, temperature) arrays of the buffered samples, oldest first.
+        The mirrored layout makes the window one contiguous slice; it is copied because the plot
+        keeps the arrays it is given and add_data overwrites the slots once the buffer wraps.
+        """
+        end = self._write_index + self.buffer_size
+        return self.time_buffer[end - self._count:end].copy(), self.temp_buffer[end - self._count:end].copy()
+
+    def clear_buffers(self):
+        self._write_index = 0
+        self._count = 0
\ No newline at end of file